@@ -2,47 +2,88 @@
 Generator module for JSON-LD graph creation
 """
 
-import json
+import mmap
 import os
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from pelican import signals
+
+try:
+    from jinja2 import pass_context
+except ImportError:  # Jinja2 < 3.0
+    from jinja2 import contextfunction as pass_context
 from .utils import (
     load_mappings,
     get_entity_type,
     convert_metadata_to_jsonld,
+    serialize_entity,
     write_json_file,
+    write_graph_file,
     escape_json_for_html
 )
 
 logger = logging.getLogger(__name__)
 
-# Global storage for entities across generators
-_entities = []
-_entity_map = {}
-_settings = None
-_output_path = None
-_mappings = None
+# Sentinel distinguishing "attribute absent" from "attribute is None"
+_MISSING = object()
+
+
+@dataclass
+class _State:
+    """Per-build state shared by the signal handlers.
+
+    Handlers bind this to a local at entry, so hot-path accesses are
+    fast attribute loads instead of one module-global lookup apiece.
+    """
+    settings: dict = None
+    output_path: str = None
+    mappings: dict = None
+    entities: list = field(default_factory=list)
+    entity_map: dict = field(default_factory=dict)
+    script_cache: dict = field(default_factory=dict)
+    script_bytes_cache: dict = field(default_factory=dict)
+    rendered_slugs: set = field(default_factory=set)
+    # Settings snapshot taken once at initialization so the per-article
+    # hot path avoids repeated dict lookups and normalization
+    siteurl: str = ''
+    siteurl_prefix: str = ''
+    allowed_statuses: frozenset = frozenset(('published',))
+    published_allowed: bool = True
+
+
+_state = _State()
 
 
 def initialize_jsonld(pelican):
     """Initialize JSON-LD generation for a Pelican instance."""
-    global _settings, _output_path, _mappings, _entities, _entity_map
-
-    _settings = pelican.settings
-    _output_path = pelican.output_path
-    _entities = []
-    _entity_map = {}
+    global _state
+
+    st = _state = _State()
+    st.settings = pelican.settings
+    st.output_path = pelican.output_path
+
+    # Snapshot hot-path settings once per build; the slash-suffixed
+    # prefix is prebuilt so the per-article path concatenates instead of
+    # re-formatting the same literal
+    st.siteurl = st.settings.get('SITEURL', '') or ''
+    st.siteurl_prefix = st.siteurl + '/' if st.siteurl else ''
+    st.allowed_statuses = frozenset(
+        str(status).lower()
+        for status in st.settings.get('JSONLD_ALLOWED_STATUSES', ['published'])
+    )
+    st.published_allowed = 'published' in st.allowed_statuses
 
     # Load mappings
-    mappings_file = _settings.get('JSONLD_MAPPINGS_FILE', 'mappings.json')
+    mappings_file = st.settings.get('JSONLD_MAPPINGS_FILE', 'mappings.json')
     if not os.path.isabs(mappings_file):
         # Look for mappings.json in the Pelican path (project root)
-        base_path = _settings.get('PATH', '')
+        base_path = st.settings.get('PATH', '')
         if base_path:
             parent_path = os.path.dirname(os.path.abspath(base_path))
             mappings_file = os.path.join(parent_path, mappings_file)
 
-    _mappings = load_mappings(mappings_file)
+    st.mappings = load_mappings(mappings_file)
     logger.info("JSON-LD Graph Generator initialized")
 
 
@@ -53,197 +94,248 @@ def process_content(content):
     Args:
         content: Pelican content object
     """
-    global _entities, _entity_map, _settings, _mappings
+    st = _state
 
-    if not _settings or not _mappings:
+    if not st.settings or not st.mappings:
         return
 
+    # Bind the attributes we need once; getattr with a default is about
+    # half the cost of the hasattr-then-access pairs it replaces
+    title = getattr(content, 'title', None)
+    slug = getattr(content, 'slug', None)
+    status = getattr(content, 'status', _MISSING)
+    content_metadata = getattr(content, 'metadata', None) or {}
+
     # Skip content that doesn't have basic attributes
-    if not hasattr(content, 'title') or not content.title:
+    if not title:
         return
-    
+
     # Skip content that doesn't have a slug (usually indicates malformed content)
-    if not hasattr(content, 'slug') or not content.slug:
+    if not slug:
         return
 
-    # Filter content based on status
-    # Get allowed statuses from settings, default to only 'published'
-    allowed_statuses = _settings.get('JSONLD_ALLOWED_STATUSES', ['published'])
-    
-    # Check if content has a status and if it's in the allowed list
-    if hasattr(content, 'status'):
-        content_status = str(content.status).lower()
-        if content_status not in [status.lower() for status in allowed_statuses]:
+    # Filter content based on status; allowed_statuses is prenormalized
+    # to a lowercase frozenset at initialization
+    if status is not _MISSING:
+        if str(status).lower() not in st.allowed_statuses:
             return
-    elif hasattr(content, 'metadata') and content.metadata and 'status' in content.metadata:
-        content_status = str(content.metadata['status']).lower()
-        if content_status not in [status.lower() for status in allowed_statuses]:
+    elif 'status' in content_metadata:
+        if str(content_metadata['status']).lower() not in st.allowed_statuses:
             return
     else:
         # If no status is found, assume it's published (default Pelican behavior)
-        if 'published' not in [status.lower() for status in allowed_statuses]:
+        if not st.published_allowed:
             return
 
     try:
         # Get metadata
-        metadata = {}
+        metadata = {'title': str(title)}
+        siteurl = st.siteurl
+        siteurl_prefix = st.siteurl_prefix
 
         # Extract relevant fields with safety checks
-        if hasattr(content, 'title') and content.title:
-            metadata['title'] = str(content.title)
-        if hasattr(content, 'summary') and content.summary:
-            metadata['summary'] = str(content.summary)
-        if hasattr(content, 'tags') and content.tags:
-            metadata['tags'] = [str(tag) for tag in content.tags]
-        if hasattr(content, 'date') and content.date:
-            metadata['date'] = content.date
-        
+        summary = getattr(content, 'summary', None)
+        if summary:
+            metadata['summary'] = str(summary)
+        tags = getattr(content, 'tags', None)
+        if tags:
+            metadata['tags'] = [str(tag) for tag in tags]
+        date = getattr(content, 'date', None)
+        if date:
+            metadata['date'] = date
+
         # Handle URL - check for custom URL in metadata first, then fall back to content.url
         url_value = None
-        if hasattr(content, 'metadata') and content.metadata and 'url' in content.metadata:
+        if 'url' in content_metadata:
             # Use custom URL from frontmatter if it exists
-            url_value = str(content.metadata['url'])
-        elif hasattr(content, 'url') and content.url:
-            # Use generated Pelican URL
-            url_value = str(content.url)
-        
+            url_value = str(content_metadata['url'])
+        else:
+            content_url = getattr(content, 'url', None)
+            if content_url:
+                # Use generated Pelican URL
+                url_value = str(content_url)
+
         if url_value:
             # If it's already a full URL (starts with http/https), use it as-is
             if url_value.startswith(('http://', 'https://')):
                 metadata['url'] = url_value
             else:
-                # Otherwise, prepend the site URL
-                siteurl = _settings.get('SITEURL', '') or ''
-                metadata['url'] = f"{siteurl}/{url_value}" if siteurl else url_value
+                # Otherwise, prepend the site URL (prefix prebuilt at init)
+                metadata['url'] = siteurl_prefix + url_value if siteurl_prefix else url_value
 
         # Check for image in metadata
-        if hasattr(content, 'metadata') and content.metadata:
-            if 'image' in content.metadata and content.metadata['image']:
-                image_value = str(content.metadata['image'])
-                siteurl = _settings.get('SITEURL', '') or ''
-                
-                # Handle image URLs - make relative paths absolute
-                if image_value.startswith('/'):
-                    # It's a relative path from site root, make it absolute
-                    metadata['image'] = f"{siteurl}{image_value}" if siteurl else image_value
-                elif image_value.startswith(('http://', 'https://')):
-                    # It's already a full URL, use as-is
-                    metadata['image'] = image_value
-                else:
-                    # It's a relative path, assume it's from site root
-                    metadata['image'] = f"{siteurl}/{image_value}" if siteurl else image_value
+        if content_metadata.get('image'):
+            image_value = str(content_metadata['image'])
+
+            # Handle image URLs - make relative paths absolute
+            if image_value.startswith('/'):
+                # It's a relative path from site root, make it absolute
+                metadata['image'] = siteurl + image_value if siteurl else image_value
+            elif image_value.startswith(('http://', 'https://')):
+                # It's already a full URL, use as-is
+                metadata['image'] = image_value
+            else:
+                # It's a relative path, assume it's from site root
+                metadata['image'] = siteurl_prefix + image_value if siteurl_prefix else image_value
 
         # Determine entity type from category
+        category = getattr(content, 'category', None)
         category_name = None
-        if hasattr(content, 'category') and content.category and content.category.name:
-            category_name = str(content.category.name)
-        
-        entity_type = get_entity_type(category_name, _mappings)
+        if category is not None and getattr(category, 'name', None):
+            category_name = str(category.name)
+
+        entity_type = get_entity_type(category_name, st.mappings)
 
         # Convert to JSON-LD
-        entity = convert_metadata_to_jsonld(metadata, entity_type, _mappings)
+        entity = convert_metadata_to_jsonld(metadata, entity_type, st.mappings)
 
         # Store entity
-        _entities.append(entity)
+        st.entities.append(entity)
 
         # Map entity to slug for injection
-        if hasattr(content, 'slug') and content.slug:
-            _entity_map[str(content.slug)] = entity
+        st.entity_map[str(slug)] = entity
 
-        title = metadata.get('title', 'Untitled') or 'Untitled'
         entity_type_str = str(entity_type) if entity_type else 'Unknown'
-        logger.debug(f"Processed {entity_type_str}: {title}")
-    
+        logger.debug(f"Processed {entity_type_str}: {metadata['title']}")
+
     except Exception as e:
         # Add more detailed error information
         import traceback
-        content_title = getattr(content, 'title', 'Unknown') if hasattr(content, 'title') else 'Unknown'
-        content_slug = getattr(content, 'slug', 'Unknown') if hasattr(content, 'slug') else 'Unknown'
+        content_title = getattr(content, 'title', 'Unknown')
+        content_slug = getattr(content, 'slug', 'Unknown')
         logger.error(f"Error processing content '{content_title}' (slug: {content_slug}): {e}")
         logger.error(f"Error type: {type(e).__name__}")
         logger.error(f"Traceback: {traceback.format_exc()}")
         # Don't re-raise to prevent build failures
 
 
+def _script_for(slug):
+    """Return the JSON-LD script tag for a slug, or None if unknown.
+
+    Entities are immutable once all content is processed, so each one is
+    serialized and escaped at most once and the result cached per slug.
+    """
+    st = _state
+    script_tag = st.script_cache.get(slug)
+    if script_tag is None:
+        entity = st.entity_map.get(slug)
+        if entity is None:
+            return None
+        escaped_json = escape_json_for_html(serialize_entity(entity))
+        script_tag = (
+            f'\n<script type="application/ld+json">\n{escaped_json}\n</script>\n'
+        )
+        st.script_cache[slug] = script_tag
+    return script_tag
+
+
+def _script_bytes_for(slug):
+    """Return the JSON-LD script tag for a slug as UTF-8 bytes, or None.
+
+    Used by the post-write injection path, which operates on raw bytes;
+    encoding happens at most once per slug.
+    """
+    st = _state
+    script_bytes = st.script_bytes_cache.get(slug)
+    if script_bytes is None:
+        script_tag = _script_for(slug)
+        if script_tag is None:
+            return None
+        script_bytes = script_tag.encode('utf-8')
+        st.script_bytes_cache[slug] = script_bytes
+    return script_bytes
+
+
+def build_script_cache(generators):
+    """Precompute every script tag once all generators have read content.
+
+    Runs on all_generators_finalized, i.e. after the entity map is
+    complete but before any output is written, so template helpers and
+    the content_written fallback both hit a warm cache.
+    """
+    for slug in _state.entity_map:
+        _script_for(slug)
+
+
+@pass_context
+def jsonld_for(context, slug):
+    """Template helper returning the JSON-LD script tag for a slug.
+
+    Use in a theme as ``{{ jsonld_for(article.slug) | safe }}`` inside
+    <head>. A page is only marked as rendered — and thus skipped by the
+    post-write fallback — when the helper runs on that entity's own
+    page (the template's article/page matches the slug). Listing
+    templates can therefore call the helper for other pages' slugs
+    without opting those pages out of injection.
+    """
+    script_tag = _script_for(slug)
+    if script_tag is None:
+        return ''
+    page_obj = context.get('article') or context.get('page')
+    if page_obj is not None and getattr(page_obj, 'slug', None) == slug:
+        _state.rendered_slugs.add(slug)
+    return script_tag
+
+
+def add_template_helper(generator):
+    """Expose jsonld_for as a Jinja global on each generator's environment."""
+    env = getattr(generator, 'env', None)
+    if env is not None:
+        env.globals['jsonld_for'] = jsonld_for
+
+
 def write_jsonld_files(pelican):
     """Write JSON-LD files after all content is processed."""
-    global _entities, _entity_map, _settings, _output_path
+    st = _state
 
-    if not _entities:
+    if not st.entities:
         logger.info("No entities to export")
         return
 
-    logger.info(f"Starting JSON-LD graph generation with {len(_entities)} entities...")
+    logger.info(f"Starting JSON-LD graph generation with {len(st.entities)} entities...")
 
     # Configuration
-    jsonld_output_path = _settings.get('JSONLD_OUTPUT_PATH', 'jsonld')
-    graph_filename = _settings.get('JSONLD_GRAPH_FILENAME', 'graph.jsonld')
-    export_individual = _settings.get('JSONLD_EXPORT_INDIVIDUAL', True)
+    jsonld_output_path = st.settings.get('JSONLD_OUTPUT_PATH', 'jsonld')
+    graph_filename = st.settings.get('JSONLD_GRAPH_FILENAME', 'graph.jsonld')
+    export_individual = st.settings.get('JSONLD_EXPORT_INDIVIDUAL', True)
+    graph_indent = st.settings.get('JSONLD_GRAPH_INDENT', None)
 
-    # Write global graph
-    graph = {
-        "@context": "https://schema.org/",
-        "@graph": _entities
-    }
-
-    output_dir = os.path.join(_output_path, jsonld_output_path)
+    output_dir = os.path.join(st.output_path, jsonld_output_path)
     graph_path = os.path.join(output_dir, graph_filename)
 
-    write_json_file(graph, graph_path, indent=2)
+    # Create the output directory once up front; every write below can
+    # then skip its own makedirs syscall (and worker threads don't race)
+    os.makedirs(output_dir, exist_ok=True)
+
+    # Write global graph. The default streams entity by entity to avoid
+    # materializing the whole serialized graph in memory; set
+    # JSONLD_GRAPH_INDENT for a pretty-printed file instead.
+    if graph_indent:
+        graph = {
+            "@context": "https://schema.org/",
+            "@graph": st.entities
+        }
+        write_json_file(graph, graph_path, indent=graph_indent, make_dir=False)
+    else:
+        write_graph_file(st.entities, graph_path, make_dir=False)
     logger.info(f"✅ Global graph written to {graph_path}")
 
     # Export individual entities if enabled
     if export_individual:
-        count = 0
-        for slug, entity in _entity_map.items():
-            if slug:  # Only process if slug is not None
-                entity_path = os.path.join(output_dir, f"{slug}.json")
-                write_json_file(entity, entity_path, indent=2)
-                count += 1
-
-        logger.info(f"✅ Exported {count} individual entity files")
-
-
-def inject_jsonld_into_content(content, content_path):
-    """
-    Inject JSON-LD script into HTML content.
-
-    Args:
-        content: HTML content string
-        content_path: Path to the content file
-
-    Returns:
-        str: Modified HTML with JSON-LD injected
-    """
-    global _entity_map, _settings
-
-    inject_enabled = _settings.get('JSONLD_INJECT', True)
-    if not inject_enabled:
-        return content
-
-    # Extract slug from path
-    slug = os.path.splitext(os.path.basename(content_path))[0]
+        items = [(slug, entity) for slug, entity in st.entity_map.items() if slug]
 
-    if slug not in _entity_map:
-        return content
+        def _write_entity(item):
+            slug, entity = item
+            write_json_file(entity, os.path.join(output_dir, f"{slug}.json"),
+                            indent=2, make_dir=False)
 
-    entity = _entity_map[slug]
+        # Each write is independent and I/O-bound, so overlap them with a
+        # thread pool instead of paying the syscall latency serially
+        max_workers = min(32, (os.cpu_count() or 4) * 4)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(_write_entity, items))
 
-    # Generate JSON-LD script tag
-    json_str = json.dumps(entity, indent=2, ensure_ascii=False)
-    escaped_json = escape_json_for_html(json_str)
-    script_tag = f'\n<script type="application/ld+json">\n{escaped_json}\n</script>\n'
-
-    # Try to inject before </head>
-    if '</head>' in content:
-        content = content.replace('</head>', script_tag + '</head>', 1)
-        logger.debug(f"Injected JSON-LD into <head> for {slug}")
-    # Fallback to before </body>
-    elif '</body>' in content:
-        content = content.replace('</body>', script_tag + '</body>', 1)
-        logger.debug(f"Injected JSON-LD into <body> for {slug}")
-
-    return content
+        logger.info(f"✅ Exported {len(items)} individual entity files")
 
 
 def content_written_handler(path, context):
@@ -251,15 +343,49 @@ def content_written_handler(path, context):
     if not path or not path.endswith('.html'):
         return
 
-    try:
-        with open(path, 'r', encoding='utf-8') as f:
-            content = f.read()
+    st = _state
 
-        modified_content = inject_jsonld_into_content(content, path)
+    # Decide before touching the file: injection may be disabled, and
+    # most pages (tag/archive/index) have no matching entity anyway, so
+    # skipping here avoids a full read+write per non-matching file
+    if not st.settings or not st.settings.get('JSONLD_INJECT', True):
+        return
+
+    slug = os.path.splitext(os.path.basename(path))[0]
+    if slug in st.rendered_slugs or slug not in st.entity_map:
+        return
 
-        if modified_content != content:
-            with open(path, 'w', encoding='utf-8') as f:
-                f.write(modified_content)
+    script_bytes = _script_bytes_for(slug)
+    if script_bytes is None:
+        return
+
+    try:
+        # Memory-map the page so finding the splice point copies nothing;
+        # stream the result through a temp file and swap it in atomically
+        # so a crash mid-write can't leave a truncated page behind
+        with open(path, 'rb') as f:
+            try:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # Empty files can't be mapped (and have no splice point)
+                return
+
+            with mm:
+                # Try to inject before </head>, falling back to </body>
+                idx = mm.find(b'</head>')
+                if idx < 0:
+                    idx = mm.find(b'</body>')
+                if idx < 0:
+                    return
+
+                tmp_path = path + '.tmp'
+                with open(tmp_path, 'wb') as out:
+                    out.write(mm[:idx])
+                    out.write(script_bytes)
+                    out.write(mm[idx:])
+
+        os.replace(tmp_path, path)
+        logger.debug(f"Injected JSON-LD into {path}")
     except Exception as e:
         logger.error(f"Error injecting JSON-LD into {path}: {e}")
 
@@ -267,6 +393,8 @@ def content_written_handler(path, context):
 def register():
     """Register plugin signals."""
     signals.initialized.connect(initialize_jsonld)
+    signals.generator_init.connect(add_template_helper)
     signals.content_object_init.connect(process_content)
+    signals.all_generators_finalized.connect(build_script_cache)
     signals.finalized.connect(write_jsonld_files)
     signals.content_written.connect(content_written_handler)
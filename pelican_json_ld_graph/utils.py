@@ -7,8 +7,42 @@ import os
 import re
 import logging
 
+try:
+    import orjson
+except ImportError:
+    # orjson is an optional speedup; fall back to the stdlib encoder
+    orjson = None
+
 logger = logging.getLogger(__name__)
 
+# Matches HTML tags for stripping markup out of text fields
+_HTML_TAG_RE = re.compile(r'<[^>]+>')
+
+
+def _default(obj):
+    """
+    orjson fallback for values it won't serialize natively.
+
+    orjson handles plain datetime but raises for subclasses like
+    Pelican's SafeDatetime; defer to isoformat() when available.
+    """
+    isoformat = getattr(obj, 'isoformat', None)
+    if isoformat is not None:
+        return isoformat()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+# Characters that are unsafe inside an inline <script> block, mapped to
+# their JSON escape sequences. A single str.translate pass over the
+# string replaces them all in one C-level loop.
+_JSON_HTML_TABLE = str.maketrans({
+    '<': '\\u003c',
+    '>': '\\u003e',
+    '&': '\\u0026',
+    '\u2028': '\\u2028',
+    '\u2029': '\\u2029',
+})
+
 DEFAULT_MAPPINGS = {
     "categories": {
         "people": "Person",
@@ -38,19 +72,32 @@ def load_mappings(mappings_path=None):
     Returns:
         dict: Mapping configuration
     """
+    mappings = None
     if mappings_path and os.path.exists(mappings_path):
         try:
             with open(mappings_path, 'r', encoding='utf-8') as f:
                 mappings = json.load(f)
-                logger.info(f"Loaded mappings from {mappings_path}")
-                return mappings
+            logger.info(f"Loaded mappings from {mappings_path}")
         except Exception as e:
             logger.warning(f"Failed to load mappings from {mappings_path}: {e}")
             logger.warning("Using default mappings")
     else:
         logger.info("No mappings.json found, using defaults")
 
-    return DEFAULT_MAPPINGS
+    if mappings is None:
+        mappings = dict(DEFAULT_MAPPINGS)
+
+    # Normalize category keys to lowercase once here, so every per-article
+    # get_entity_type call is a single dict lookup regardless of the
+    # casing used in mappings.json
+    # (supports both 'categories' and the deprecated 'folders' key)
+    categories = mappings.get('categories', mappings.get('folders', {}))
+    mappings['_categories_lc'] = {k.lower(): v for k, v in categories.items()}
+
+    # Compile a converter specialized for this build's field mappings
+    mappings['_converter'] = build_converter(mappings)
+
+    return mappings
 
 
 def get_entity_type(category_name, mappings):
@@ -64,20 +111,74 @@ def get_entity_type(category_name, mappings):
     Returns:
         str: Schema.org type (e.g., 'Person', 'CreativeWork')
     """
-    # Support both 'categories' (new) and 'folders' (deprecated) for backwards compatibility
-    category_mappings = mappings.get('categories', mappings.get('folders', {}))
+    # load_mappings pre-normalizes category keys to lowercase; fall back
+    # to normalizing here for mappings that didn't come through it
+    category_mappings = mappings.get('_categories_lc')
+    if category_mappings is None:
+        # Support both 'categories' (new) and 'folders' (deprecated)
+        categories = mappings.get('categories', mappings.get('folders', {}))
+        category_mappings = {k.lower(): v for k, v in categories.items()}
 
     if category_name:
-        # Normalize category name to lowercase for case-insensitive matching
-        category_key = category_name.lower()
-        entity_type = category_mappings.get(category_key)
-        if entity_type:
-            return entity_type
+        return category_mappings.get(category_name.lower(), "Thing")
 
     # Default to Thing if no mapping found
     return "Thing"
 
 
+def build_converter(mappings):
+    """
+    Generate a metadata converter specialized for a fixed field mapping.
+
+    The field mapping never changes within a build, so instead of
+    iterating field_mappings.items() and re-dispatching on the field
+    name for every entity, emit straight-line code for exactly the
+    configured fields and exec it once. The result behaves like
+    convert_metadata_to_jsonld without the per-field branching.
+
+    Args:
+        mappings: Mapping configuration
+
+    Returns:
+        callable: (metadata, entity_type) -> JSON-LD entity dict
+    """
+    field_mappings = mappings.get('fields', {})
+
+    lines = [
+        "def _convert(metadata, entity_type):",
+        "    entity = {'@type': entity_type}",
+    ]
+    for source_field, target_field in field_mappings.items():
+        src = repr(source_field)
+        lines.append(f"    value = metadata.get({src})")
+        lines.append("    if value is not None:")
+        if source_field == 'date':
+            # Convert unconditionally: Pelican stores dates as a
+            # datetime subclass (SafeDatetime), which orjson refuses to
+            # serialize even though it handles plain datetime natively
+            lines.append("        if hasattr(value, 'isoformat'):")
+            lines.append("            value = value.isoformat()")
+            lines.append("        elif isinstance(value, (list, tuple)):")
+            lines.append("            value = value[0] if value else ''")
+        elif source_field == 'tags':
+            # Tags stay a list for keywords
+            pass
+        else:
+            lines.append("        if isinstance(value, (list, tuple)):")
+            lines.append("            value = value[0] if value else ''")
+        if source_field in ('summary', 'description'):
+            lines.append("        if isinstance(value, str):")
+            lines.append("            if '<' in value:")
+            lines.append("                value = _HTML_TAG_RE.sub('', value)")
+            lines.append("            value = value.strip()")
+        lines.append(f"        entity[{target_field!r}] = value")
+    lines.append("    return entity")
+
+    namespace = {'_HTML_TAG_RE': _HTML_TAG_RE}
+    exec('\n'.join(lines), namespace)
+    return namespace['_convert']
+
+
 def convert_metadata_to_jsonld(metadata, entity_type, mappings):
     """
     Convert article metadata to JSON-LD entity.
@@ -90,6 +191,12 @@ def convert_metadata_to_jsonld(metadata, entity_type, mappings):
     Returns:
         dict: JSON-LD entity
     """
+    # Use the specialized converter when the mappings came through
+    # load_mappings; the generic loop below covers everything else
+    converter = mappings.get('_converter')
+    if converter is not None:
+        return converter(metadata, entity_type)
+
     field_mappings = mappings.get('fields', {})
 
     entity = {
@@ -105,7 +212,9 @@ def convert_metadata_to_jsonld(metadata, entity_type, mappings):
             if value is None:
                 continue
 
-            # Handle special cases
+            # Handle special cases. Convert dates here even when orjson
+            # is available: Pelican's SafeDatetime is a datetime
+            # subclass, which orjson refuses to serialize
             if source_field == 'date' and hasattr(value, 'isoformat'):
                 value = value.isoformat()
             elif source_field == 'tags' and isinstance(value, list):
@@ -115,10 +224,12 @@ def convert_metadata_to_jsonld(metadata, entity_type, mappings):
                 # Convert other lists to first item or comma-separated string
                 value = value[0] if value else ""
 
-            # Strip HTML tags from text fields
+            # Strip HTML tags from text fields; most summaries contain no
+            # markup at all, so only run the regex when a '<' is present
             if isinstance(value, str) and source_field in ('summary', 'description'):
-                # Remove HTML tags
-                value = re.sub(r'<[^>]+>', '', value).strip()
+                if '<' in value:
+                    value = _HTML_TAG_RE.sub('', value)
+                value = value.strip()
             
             # Ensure value is not None before adding to entity
             if value is not None:
@@ -127,25 +238,90 @@ def convert_metadata_to_jsonld(metadata, entity_type, mappings):
     return entity
 
 
-def write_json_file(data, output_path, indent=2):
+def write_json_file(data, output_path, indent=2, make_dir=True):
     """
     Write JSON data to file.
 
     Args:
         data: Data to write
         output_path: Output file path
-        indent: JSON indentation level
+        indent: Truthy to pretty-print with two-space indentation,
+            falsy for compact output. orjson only supports two-space
+            indentation, so the stdlib path matches it rather than
+            honoring other widths
+        make_dir: Create the parent directory if needed; pass False when
+            the caller has already created it to skip the extra syscall
     """
-    dir_path = os.path.dirname(output_path)
-    if dir_path:  # Only create directory if path contains a directory component
-        os.makedirs(dir_path, exist_ok=True)
-
-    with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=indent, ensure_ascii=False)
+    if make_dir:
+        dir_path = os.path.dirname(output_path)
+        if dir_path:  # Only create directory if path contains a directory component
+            os.makedirs(dir_path, exist_ok=True)
+
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        # Write orjson's bytes directly to avoid a decode/encode round-trip
+        with open(output_path, 'wb') as f:
+            f.write(orjson.dumps(data, default=_default, option=option))
+    else:
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2 if indent else None,
+                      ensure_ascii=False)
 
     logger.debug(f"Wrote JSON to {output_path}")
 
 
+def write_graph_file(entities, output_path, make_dir=True):
+    """
+    Stream the global @graph file to disk one entity at a time.
+
+    Serializing entities individually keeps peak memory at roughly one
+    entity's buffer instead of the whole serialized graph. The output is
+    compact (no indentation) since graph.jsonld is a machine-read file.
+
+    Args:
+        entities: Iterable of JSON-LD entity dictionaries
+        output_path: Output file path
+        make_dir: Create the parent directory if needed
+    """
+    if make_dir:
+        dir_path = os.path.dirname(output_path)
+        if dir_path:
+            os.makedirs(dir_path, exist_ok=True)
+
+    with open(output_path, 'wb') as f:
+        f.write(b'{"@context":"https://schema.org/","@graph":[')
+        first = True
+        for entity in entities:
+            if not first:
+                f.write(b',')
+            first = False
+            if orjson is not None:
+                f.write(orjson.dumps(entity, default=_default))
+            else:
+                f.write(json.dumps(entity, ensure_ascii=False).encode('utf-8'))
+        f.write(b']}')
+
+    logger.debug(f"Wrote JSON-LD graph to {output_path}")
+
+
+def serialize_entity(entity):
+    """
+    Serialize a JSON-LD entity to an indented JSON string.
+
+    Args:
+        entity: JSON-LD entity dictionary
+
+    Returns:
+        str: Indented JSON string
+    """
+    if orjson is not None:
+        return orjson.dumps(entity, default=_default,
+                            option=orjson.OPT_INDENT_2).decode('utf-8')
+    return json.dumps(entity, indent=2, ensure_ascii=False)
+
+
 def escape_json_for_html(json_str):
     """
     Escape JSON string for safe HTML injection.
@@ -156,7 +332,6 @@ def escape_json_for_html(json_str):
     Returns:
         str: Escaped JSON string
     """
-    # Escape closing script tags and other problematic characters
-    return (json_str
-            .replace('</', '<\\/')
-            .replace('</script>', '<\\/script>'))
+    # Escape every HTML-unsafe character (including the U+2028/U+2029
+    # line separators, which break inline JS) in a single translate pass
+    return json_str.translate(_JSON_HTML_TABLE)